@@ -3,15 +3,27 @@ Flask wrapper để chạy sync script như Web Service trên Render
 Optimized: Sync tối ưu các cột, map assignees thông minh hơn
 """
 
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from difflib import SequenceMatcher, get_close_matches
 from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
-import json
+import orjson
 from dotenv import load_dotenv
 import re
+import hmac
+import hashlib
+import fcntl
+import unicodedata
+import atexit
+import tempfile
 
 # Load environment variables
 load_dotenv()
@@ -21,13 +33,116 @@ NOTION_API_TOKEN = os.getenv("NOTION_API_TOKEN")
 NOTION_DATABASE_ID = os.getenv("NOTION_DATABASE_ID")
 CLICKUP_API_TOKEN = os.getenv("CLICKUP_API_TOKEN")
 CLICKUP_LIST_ID = os.getenv("CLICKUP_LIST_ID")
+# ID custom field (text) trên list ClickUp để lưu Notion ID, bỏ trống thì chỉ dùng description
+CLICKUP_NOTION_FIELD_ID = os.getenv("CLICKUP_NOTION_FIELD_ID")
+
+# Số request ClickUp chạy song song mỗi lần sync, giữ nhỏ để không dồn tải lên ClickUp
+MAX_WORKERS = int(os.getenv("SYNC_MAX_WORKERS", "5"))
+
+# Tắt (=0) khi sync được chạy ngoài web process bằng sync_once.py
+RUN_BACKGROUND_SYNC = os.getenv("RUN_BACKGROUND_SYNC", "1") == "1"
+# Chu kỳ poll (giây), khi đã bật Notion webhook có thể tăng lên vài phút làm lưới an toàn
+SYNC_INTERVAL = int(os.getenv("SYNC_INTERVAL", "15"))
+# Khi liên tục không có task mới, chu kỳ poll nhân đôi dần tới mức này (= SYNC_INTERVAL để tắt)
+SYNC_MAX_INTERVAL = int(os.getenv("SYNC_MAX_INTERVAL", "300"))
+# verification_token của Notion webhook, dùng để kiểm tra X-Notion-Signature
+NOTION_WEBHOOK_TOKEN = os.getenv("NOTION_WEBHOOK_TOKEN")
 
 RENDER_DISK_PATH = os.getenv("RENDER_DISK_PATH", ".")
 KNOWN_TASKS_FILE = os.path.join(RENDER_DISK_PATH, "known_tasks.json")
+# Log append-only các task_ids mới giữa 2 lần ghi snapshot known_tasks.json
+KNOWN_TASKS_LOG = os.path.join(RENDER_DISK_PATH, "known_tasks.log")
+USERS_CACHE_FILE = os.path.join(RENDER_DISK_PATH, "clickup_users.json")
+# Index notion_id -> clickup task id, giữ qua các lần restart
+TASK_MAPPING_FILE = os.path.join(RENDER_DISK_PATH, "task_mapping.json")
+# flock trên file này để chỉ 1 process (gunicorn worker, sync_once.py) sync tại 1 thời điểm
+SYNC_LOCK_FILE = os.path.join(RENDER_DISK_PATH, "sync.lock")
+# Tạo thư mục data 1 lần lúc start thay vì mỗi lần ghi file
+os.makedirs(RENDER_DISK_PATH, exist_ok=True)
 
 print(f"📁 Data path: {KNOWN_TASKS_FILE}")
 
+class ORJSONProvider(DefaultJSONProvider):
+    """jsonify / request.get_json dùng orjson thay cho json chuẩn"""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
+
+# ============ HTTP SESSION ============
+# Mỗi host 1 Session để tái sử dụng kết nối TCP/TLS, header mặc định set 1 lần
+NOTION_HEADERS = {
+    "Authorization": f"Bearer {NOTION_API_TOKEN}",
+    "Content-Type": "application/json",
+    "Notion-Version": "2022-06-28"
+}
+
+CLICKUP_HEADERS = {
+    "Authorization": CLICKUP_API_TOKEN,
+    "Content-Type": "application/json"
+}
+
+# Pool đủ lớn để mỗi worker luôn có sẵn 1 kết nối keep-alive
+HTTP_POOL_SIZE = max(16, MAX_WORKERS * 2)
+
+def create_http_session(headers, retry_methods):
+    """Tạo Session với header mặc định, connection pool và retry cho 429/5xx"""
+    session = requests.Session()
+    session.headers.update(headers)
+    # Luôn xin response nén (gzip/deflate, thêm br nếu có brotli) cho các list lớn
+    session.headers["Accept-Encoding"] = requests.utils.DEFAULT_ACCEPT_ENCODING
+    
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=retry_methods
+    )
+    # pool_block=True: khi burst, thread chờ kết nối keep-alive rảnh thay vì
+    # mở thêm kết nối TLS mới rồi đóng ngay sau khi dùng
+    session.mount("https://", HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE, pool_block=True, max_retries=retry))
+    return session
+
+# Notion query là POST nhưng chỉ đọc nên retry an toàn
+notion_session = create_http_session(NOTION_HEADERS, {"GET", "POST"})
+
+# Không retry POST tạo task ClickUp để tránh tạo trùng khi 5xx.
+# urllib3 cũng không retry 429 cho POST, create_clickup_task tự chờ và gửi lại
+clickup_session = create_http_session(CLICKUP_HEADERS, {"GET", "PUT"})
+
+# ============ RATE LIMIT ============
+class TokenBucket:
+    """Token bucket thread-safe: consume() chỉ chờ khi đã hết token"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def consume(self, tokens=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+# ClickUp giới hạn 100 requests/phút mỗi token, mọi request ClickUp đều lấy token ở đây.
+# Trong 60s bất kỳ có thể đi tối đa burst + rate*60 request, nên burst phải nhỏ:
+# mặc định 5 + 95 = 100, không vượt giới hạn kể cả ngay sau khi start
+CLICKUP_RATE_LIMIT = int(os.getenv("CLICKUP_RATE_LIMIT", "95"))
+CLICKUP_RATE_BURST = max(1, int(os.getenv("CLICKUP_RATE_BURST", "5")))
+clickup_rate_limiter = TokenBucket(rate=CLICKUP_RATE_LIMIT / 60, capacity=CLICKUP_RATE_BURST)
 
 # Global state
 sync_status = {
@@ -38,110 +153,328 @@ sync_status = {
     "last_error": None,
     "service_started": datetime.now().isoformat()
 }
+# Thread nền, worker sync và Flask handlers cùng đọc/ghi sync_status
+sync_status_lock = threading.Lock()
+
+def get_sync_status():
+    """Bản copy của sync_status để route trả về mà không bị đọc dở"""
+    with sync_status_lock:
+        return dict(sync_status)
+
+def is_sync_loop_running():
+    """Thread sync nền đã chạy chưa (đọc sync_status["running"] dưới lock)"""
+    with sync_status_lock:
+        return sync_status["running"]
 
 # ============ STATE MANAGEMENT ============
-def load_known_tasks():
-    if os.path.exists(KNOWN_TASKS_FILE):
+# State gồm snapshot known_tasks.json + known_tasks.log (mỗi dòng 1 lần sync:
+# {"add": [...], "last_seen_created_time": ...}). Sync thường chỉ append 1 dòng,
+# khi log đủ dài mới ghi lại snapshot và xóa log.
+KNOWN_TASKS_COMPACT_AT = 500
+
+# State đang dùng trong process, task_ids giữ dạng set giữa các lần sync
+known_tasks_memory = None
+# (mtime, size) của snapshot + log lúc đọc/ghi gần nhất, không đổi thì không parse lại
+known_tasks_mtime = None
+known_tasks_log_lines = 0
+
+# path -> (hash nội dung, mtime) lần ghi gần nhất, nội dung không đổi thì bỏ qua lần ghi (và fsync)
+written_hashes = {}
+
+def write_json_atomic(path, obj):
+    """Ghi JSON ra file tạm rồi os.replace để không bao giờ để lại file ghi dở
+    
+    Trả về False nếu bỏ qua vì file trên disk đã có đúng nội dung này.
+    """
+    blob = orjson.dumps(obj)
+    digest = hashlib.blake2b(blob, digest_size=16).digest()
+    last = written_hashes.get(path)
+    if last and last[0] == digest:
+        # mtime khác nghĩa là file đã bị process khác ghi đè/xóa, vẫn phải ghi lại
         try:
-            with open(KNOWN_TASKS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                print(f"📖 Loaded state: {len(data.get('task_ids', []))} tasks, initialized: {data.get('initialized', False)}")
-                return data
-        except Exception as e:
-            print(f"⚠️  Lỗi đọc file: {e}")
-            return {"task_ids": [], "initialized": False}
+            if os.stat(path).st_mtime_ns == last[1]:
+                return False
+        except FileNotFoundError:
+            pass
     
-    print("📝 File chưa tồn tại, tạo mới...")
-    return {"task_ids": [], "initialized": False}
+    # Mỗi lần ghi 1 file tạm riêng: có lần ghi nằm ngoài flock (warm-up index, cache users từ route),
+    # dùng chung path + ".tmp" thì 2 process có thể cùng ghi 1 inode và publish file bị trộn
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # mkstemp tạo file 0600, giữ quyền đọc như file ghi bằng open() trước đây
+            os.fchmod(f.fileno(), 0o644)
+            f.write(blob)
+            # Đẩy xuống disk trước khi rename, nếu không máy tắt đột ngột vẫn có thể ra file rỗng
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    written_hashes[path] = (digest, os.stat(path).st_mtime_ns)
+    return True
+
+def get_file_stamp(path):
+    """(mtime, size) của file, None nếu không tồn tại; size bắt được lần append trùng tick mtime"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def get_state_mtime():
+    """Stamp của (snapshot, log), None nếu file không tồn tại"""
+    return get_file_stamp(KNOWN_TASKS_FILE), get_file_stamp(KNOWN_TASKS_LOG)
+
+def replay_known_tasks_log(data):
+    """Áp các dòng trong log lên snapshot, trả về số dòng đã đọc"""
+    lines = 0
+    try:
+        with open(KNOWN_TASKS_LOG, 'rb') as f:
+            for line in f:
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # Dòng cuối có thể bị ghi dở khi process bị kill
+                    continue
+                data["task_ids"].update(entry.get("add", []))
+                cursor = entry.get("last_seen_created_time")
+                if cursor and cursor > (data.get("last_seen_created_time") or ""):
+                    data["last_seen_created_time"] = cursor
+                lines += 1
+    except FileNotFoundError:
+        pass
+    return lines
+
+def load_known_tasks():
+    global known_tasks_memory, known_tasks_mtime, known_tasks_log_lines
+    mtime = get_state_mtime()
+    if mtime[0] is None:
+        print("📝 File chưa tồn tại, tạo mới...")
+        return {"task_ids": set(), "initialized": False}
+    
+    if known_tasks_memory is not None and mtime == known_tasks_mtime:
+        return known_tasks_memory
+    
+    try:
+        with open(KNOWN_TASKS_FILE, 'rb') as f:
+            data = orjson.loads(f.read())
+        data["task_ids"] = set(data.get("task_ids", []))
+        known_tasks_log_lines = replay_known_tasks_log(data)
+        print(f"📖 Loaded state: {len(data['task_ids'])} tasks, initialized: {data.get('initialized', False)}")
+        known_tasks_memory = data
+        known_tasks_mtime = mtime
+        return data
+    except Exception as e:
+        print(f"⚠️  Lỗi đọc file: {e}")
+        return {"task_ids": set(), "initialized": False}
 
 def save_known_tasks(known_tasks):
+    """Ghi lại toàn bộ snapshot và xóa log"""
+    global known_tasks_memory, known_tasks_mtime, known_tasks_log_lines
+    known_tasks_memory = known_tasks
+    try:
+        # set chỉ chuyển sang list lúc ghi file
+        data = dict(known_tasks, task_ids=sorted(known_tasks.get("task_ids", ())))
+        write_json_atomic(KNOWN_TASKS_FILE, data)
+        # Crash trước khi xóa log cũng không sao: replay log là idempotent
+        try:
+            os.remove(KNOWN_TASKS_LOG)
+        except FileNotFoundError:
+            pass
+        known_tasks_log_lines = 0
+        known_tasks_mtime = get_state_mtime()
+        print(f"💾 Saved state: {len(data['task_ids'])} tasks")
+    except Exception as e:
+        print(f"❌ Lỗi lưu file: {e}")
+
+def append_known_tasks(known_tasks, new_ids):
+    """Ghi thêm task_ids mới (và mốc created_time) vào log thay vì ghi lại cả snapshot"""
+    global known_tasks_mtime, known_tasks_log_lines
+    if known_tasks_log_lines >= KNOWN_TASKS_COMPACT_AT:
+        save_known_tasks(known_tasks)
+        return
+    
+    entry = {
+        "add": sorted(new_ids),
+        "last_seen_created_time": known_tasks.get("last_seen_created_time")
+    }
     try:
-        os.makedirs(os.path.dirname(KNOWN_TASKS_FILE), exist_ok=True)
-        with open(KNOWN_TASKS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(known_tasks, f, indent=2, ensure_ascii=False)
-        print(f"💾 Saved state: {len(known_tasks.get('task_ids', []))} tasks")
+        with open(KNOWN_TASKS_LOG, 'ab') as f:
+            f.write(orjson.dumps(entry) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        known_tasks_log_lines += 1
+        known_tasks_mtime = get_state_mtime()
+        print(f"💾 Saved state: +{len(new_ids)} tasks ({len(known_tasks['task_ids'])} total)")
     except Exception as e:
         print(f"❌ Lỗi lưu file: {e}")
 
 # ============ STATUS & PRIORITY MAPPING ============
-def map_notion_status_to_clickup(notion_status):
-    """Map status từ Notion sang ClickUp với nhiều variants"""
-    if not notion_status:
-        return "to do"
-    
-    status = notion_status.lower().strip()
-    
+# Bảng keyword (casefold) -> giá trị ClickUp, xét theo thứ tự, khởi tạo 1 lần lúc import
+STATUS_RULES = (
     # To Do variants
-    if any(x in status for x in ["chưa", "not started", "todo", "to do", "backlog"]):
-        return "to do"
-    
+    (("chưa", "not started", "todo", "to do", "backlog"), "to do"),
     # In Progress variants
-    if any(x in status for x in ["đang", "in progress", "doing", "working"]):
-        return "in progress"
-    
+    (("đang", "in progress", "doing", "working"), "in progress"),
     # Complete variants
-    if any(x in status for x in ["hoàn", "complete", "done", "finished"]):
-        return "complete"
-    
+    (("hoàn", "complete", "done", "finished"), "complete"),
     # Closed variants
-    if any(x in status for x in ["đóng", "closed", "archived"]):
-        return "closed"
+    (("đóng", "closed", "archived"), "closed"),
+)
+DEFAULT_STATUS = "to do"
+
+# ClickUp priority: càng nhỏ càng ưu tiên cao
+PRIORITY_RULES = (
+    # Urgent/High = 1
+    (("cao", "high", "urgent", "critical", "khẩn"), 1),
+    # Normal/Medium = 3
+    (("trung", "medium", "normal", "bình thường"), 3),
+    # Low = 4
+    (("thấp", "low", "minor"), 4),
+)
+DEFAULT_PRIORITY = 3
+
+def compile_rules(rules):
+    """Gộp keywords của mỗi rule thành 1 regex, giữ nguyên thứ tự xét rule"""
+    return tuple(
+        (re.compile("|".join(map(re.escape, keywords))), value)
+        for keywords, value in rules
+    )
+
+STATUS_PATTERNS = compile_rules(STATUS_RULES)
+PRIORITY_PATTERNS = compile_rules(PRIORITY_RULES)
+
+# Notion chỉ có vài giá trị status/priority nên nhớ kết quả theo chuỗi gốc
+@lru_cache(maxsize=256)
+def map_notion_status_to_clickup(notion_status):
+    """Map status từ Notion sang ClickUp với nhiều variants"""
+    if not notion_status:
+        return DEFAULT_STATUS
     
-    return "to do"
+    status = notion_status.casefold().strip()
+    for pattern, clickup_status in STATUS_PATTERNS:
+        if pattern.search(status):
+            return clickup_status
+    
+    return DEFAULT_STATUS
 
+@lru_cache(maxsize=256)
 def map_notion_priority_to_clickup(notion_priority):
     """Map priority từ Notion sang ClickUp - càng nhỏ càng ưu tiên cao"""
     if not notion_priority:
-        return 3
-    
-    priority = notion_priority.lower()
+        return DEFAULT_PRIORITY
     
-    # Urgent/High = 1
-    if any(x in priority for x in ["cao", "high", "urgent", "critical", "khẩn"]):
-        return 1
-    
-    # Normal/Medium = 3
-    if any(x in priority for x in ["trung", "medium", "normal", "bình thường"]):
-        return 3
+    priority = notion_priority.casefold().strip()
+    for pattern, clickup_priority in PRIORITY_PATTERNS:
+        if pattern.search(priority):
+            return clickup_priority
     
-    # Low = 4
-    if any(x in priority for x in ["thấp", "low", "minor"]):
-        return 4
-    
-    return 3
+    return DEFAULT_PRIORITY
 
 # ============ CLICKUP USER MANAGEMENT (OPTIMIZED) ============
-clickup_users_cache = None
+# Cache user map có hạn dùng để nhận được thành viên mới mà không cần restart
+USERS_CACHE_TTL = int(os.getenv("USERS_CACHE_TTL", "900"))
+# Tăng khi đổi cách normalize_name để cache cũ trên disk không được dùng lại
+USER_MAP_VERSION = 2
+clickup_users_cache = {"map": None, "expires": 0.0}
+users_cache_lock = threading.Lock()
+
+# Ký tự đặc biệt bị bỏ khi chuẩn hóa tên
+SPECIAL_CHARS_PATTERN = re.compile(r'[^\w\s@.-]')
 
+@lru_cache(maxsize=4096)
 def normalize_name(name):
     """Chuẩn hóa tên để so sánh: lowercase, bỏ dấu, bỏ khoảng trắng thừa"""
     if not name:
         return ""
     
     name = name.lower().strip()
+    # Bỏ dấu tiếng Việt: "Nguyễn Đức" và "nguyen duc" cho cùng 1 key
+    name = unicodedata.normalize("NFKD", name.replace("đ", "d"))
+    name = "".join(c for c in name if not unicodedata.combining(c))
     # Bỏ các ký tự đặc biệt
-    name = re.sub(r'[^\w\s@.-]', '', name)
+    name = SPECIAL_CHARS_PATTERN.sub('', name)
     # Chuẩn hóa khoảng trắng
     name = ' '.join(name.split())
     return name
 
+def load_users_cache_file():
+    """Đọc user map đã lưu trên disk, trả về (map, fetched_at) hoặc (None, 0)"""
+    try:
+        with open(USERS_CACHE_FILE, 'rb') as f:
+            data = orjson.loads(f.read())
+        # Map build bằng cách chuẩn hóa tên cũ thì bỏ, fetch lại
+        if data.get("version") != USER_MAP_VERSION:
+            return None, 0.0
+        return data.get("users") or None, data.get("fetched_at", 0.0)
+    except FileNotFoundError:
+        return None, 0.0
+    except Exception as e:
+        print(f"⚠️  Lỗi đọc cache users: {e}")
+        return None, 0.0
+
+def save_users_cache_file(user_map, fetched_at):
+    try:
+        write_json_atomic(USERS_CACHE_FILE, {"version": USER_MAP_VERSION, "fetched_at": fetched_at, "users": user_map})
+    except Exception as e:
+        print(f"⚠️  Lỗi lưu cache users: {e}")
+
 def get_clickup_users():
-    """Cache danh sách users từ ClickUp với nhiều key để match dễ hơn"""
-    global clickup_users_cache
-    
-    if clickup_users_cache:
-        return clickup_users_cache
-    
+    """Cache danh sách users từ ClickUp với nhiều key để match dễ hơn
+    
+    Thứ tự: cache trong memory -> file trên disk (còn hạn) -> gọi ClickUp API.
+    """
+    cached = clickup_users_cache["map"]
+    if cached and time.time() < clickup_users_cache["expires"]:
+        return cached
+    
+    with users_cache_lock:
+        # Thread khác có thể đã refresh trong lúc chờ lock
+        cached = clickup_users_cache["map"]
+        if cached and time.time() < clickup_users_cache["expires"]:
+            return cached
+        
+        # Sau restart thì dùng lại map đã lưu nếu chưa quá TTL
+        disk_map, fetched_at = load_users_cache_file()
+        if disk_map and time.time() < fetched_at + USERS_CACHE_TTL:
+            print(f"📖 Loaded {len(disk_map)} user variants từ {USERS_CACHE_FILE}")
+            clickup_users_cache["map"] = disk_map
+            clickup_users_cache["expires"] = fetched_at + USERS_CACHE_TTL
+            return disk_map
+        
+        user_map = fetch_clickup_users()
+        if user_map:
+            fetched_at = time.time()
+            clickup_users_cache["map"] = user_map
+            clickup_users_cache["expires"] = fetched_at + USERS_CACHE_TTL
+            save_users_cache_file(user_map, fetched_at)
+            return user_map
+        
+        # Lỗi khi refresh thì dùng tạm cache cũ
+        return cached or disk_map or {}
+
+def invalidate_clickup_users():
+    """Đánh dấu cache users hết hạn (cả memory và disk), lần gọi sau sẽ fetch lại"""
+    with users_cache_lock:
+        clickup_users_cache["expires"] = 0.0
+        try:
+            os.remove(USERS_CACHE_FILE)
+        except FileNotFoundError:
+            pass
+
+def fetch_clickup_users():
+    """Gọi ClickUp API lấy users và build map name variants -> user_id"""
     url = f"https://api.clickup.com/api/v2/team"
-    headers = {
-        "Authorization": CLICKUP_API_TOKEN,
-        "Content-Type": "application/json"
-    }
-    
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        clickup_rate_limiter.consume()
+        response = clickup_session.get(url, timeout=10)
         response.raise_for_status()
-        teams = response.json().get("teams", [])
+        teams = orjson.loads(response.content).get("teams", [])
         
         if not teams:
             print("⚠️  Không tìm thấy team nào")
@@ -149,11 +482,14 @@ def get_clickup_users():
         
         team_id = teams[0]["id"]
         url = f"https://api.clickup.com/api/v2/team/{team_id}/user"
-        response = requests.get(url, headers=headers, timeout=10)
+        clickup_rate_limiter.consume()
+        response = clickup_session.get(url, timeout=10)
         response.raise_for_status()
-        members = response.json().get("members", [])
+        members = orjson.loads(response.content).get("members", [])
         
-        user_map = {}
+        # (độ cụ thể, variant, user_id) - số càng nhỏ càng cụ thể
+        entries = []
+        add_entry = entries.append
         
         print(f"👥 Found {len(members)} ClickUp users:")
         for member in members:
@@ -166,38 +502,43 @@ def get_clickup_users():
                 continue
             
             # Lưu nhiều variants của tên để dễ match
-            variants = set()
+            variants = []
+            
+            # Email full
+            if email:
+                variants.append((0, email))
             
             # Username
             if username:
-                variants.add(normalize_name(username))
+                variants.append((1, username))
                 print(f"   - {username} (ID: {user_id})")
             
-            # Email full và prefix
+            # Email prefix
             if email:
-                variants.add(normalize_name(email))
-                email_prefix = email.split('@')[0]
-                variants.add(normalize_name(email_prefix))
+                variants.append((2, email.split('@')[0]))
             
             # Tên từ username (nếu có dấu . hoặc _)
             if username:
-                for separator in ['.', '_', '-']:
+                for separator in ('.', '_', '-'):
                     if separator in username:
                         parts = username.split(separator)
+                        # Fullname
+                        variants.append((3, ' '.join(parts)))
                         # Firstname
-                        variants.add(normalize_name(parts[0]))
+                        variants.append((4, parts[0]))
                         # Lastname
                         if len(parts) > 1:
-                            variants.add(normalize_name(parts[-1]))
-                        # Fullname
-                        variants.add(normalize_name(' '.join(parts)))
+                            variants.append((4, parts[-1]))
             
-            # Map tất cả variants về user_id
-            for variant in variants:
-                if variant:
-                    user_map[variant] = user_id
+            for rank, variant in variants:
+                normalized = normalize_name(variant)
+                if normalized:
+                    add_entry((rank, normalized, user_id))
+        
+        # Ghi variant kém cụ thể trước: 2 user trùng variant thì key cụ thể hơn (email, username) thắng
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        user_map = {variant: user_id for _, variant, user_id in entries}
         
-        clickup_users_cache = user_map
         print(f"✅ Created {len(user_map)} name variants for matching")
         return user_map
         
@@ -207,17 +548,102 @@ def get_clickup_users():
             print(f"Response: {e.response.text}")
         return {}
 
-def map_notion_assignees_to_clickup(notion_assignees):
-    """Map assignees từ Notion sang ClickUp IDs với matching thông minh"""
+# Kết quả match (name, email) -> (user_id, matched_by), gắn với map users đã dùng để match
+assignee_matches = {"users": None, "matches": {}}
+# Độ giống tối thiểu (0-1) khi so khớp gần đúng tên assignee. Mặc định 1 = tắt (chỉ match chính xác),
+# vì gán nhầm người còn tệ hơn để trống; muốn bật thì đặt vd 0.85
+ASSIGNEE_FUZZY_CUTOFF = float(os.getenv("ASSIGNEE_FUZZY_CUTOFF", "1"))
+# Kết quả gần đúng tốt nhất phải hơn ứng viên của user khác ít nhất chừng này mới được nhận
+ASSIGNEE_FUZZY_MARGIN = 0.05
+
+def pick_fuzzy_assignee(clickup_users, normalized_name):
+    """So khớp gần đúng, trả về variant được chọn hoặc None nếu không đủ chắc chắn"""
+    candidates = get_close_matches(normalized_name, clickup_users.keys(), n=5, cutoff=ASSIGNEE_FUZZY_CUTOFF)
+    if not candidates:
+        return None
+    best = candidates[0]
+    
+    # Chỉ khác nhau ở từ cuối (tên gọi, vd "tran van an" / "tran van anh") là 2 người khác nhau
+    name_parts, best_parts = normalized_name.split(), best.split()
+    if len(name_parts) > 1 and len(name_parts) == len(best_parts) and name_parts[:-1] == best_parts[:-1]:
+        return None
+    
+    # Ứng viên gần nhất của 1 user khác mà sát điểm thì không đoán
+    best_score = SequenceMatcher(None, normalized_name, best).ratio()
+    for other in candidates[1:]:
+        if clickup_users[other] != clickup_users[best]:
+            if best_score - SequenceMatcher(None, normalized_name, other).ratio() < ASSIGNEE_FUZZY_MARGIN:
+                return None
+            break
+    return best
+
+def resolve_assignee(clickup_users, name, email):
+    """Tìm ClickUp user ID cho 1 assignee: email -> email prefix -> tên -> từng phần tên"""
+    lookup = clickup_users.get
+    
+    # Try match by email first (chính xác nhất), chuẩn hóa email 1 lần
+    if email:
+        normalized_email = normalize_name(email)
+        user_id = lookup(normalized_email)
+        if user_id:
+            return user_id, f"email: {email}"
+        
+        # Try email prefix
+        email_prefix = normalized_email.split('@')[0]
+        user_id = lookup(email_prefix)
+        if user_id:
+            return user_id, f"email prefix: {email_prefix}"
+    
+    # Try match by name
+    if name:
+        normalized_name = normalize_name(name)
+        user_id = lookup(normalized_name)
+        if user_id:
+            return user_id, f"name: {name}"
+        
+        # Try first/last name
+        for part in normalized_name.split():
+            user_id = lookup(part)
+            if user_id:
+                return user_id, f"name part: {part}"
+        
+        # Fallback: so khớp gần đúng, vd "nguyen van a" với "nguyenvana"
+        if ASSIGNEE_FUZZY_CUTOFF < 1:
+            close = pick_fuzzy_assignee(clickup_users, normalized_name)
+            if close:
+                return lookup(close), f"fuzzy: {close}"
+    
+    return None, None
+
+def match_assignee(clickup_users, name, email):
+    """resolve_assignee có nhớ kết quả, tự bỏ cache khi map users được refresh"""
+    global assignee_matches
+    cache = assignee_matches
+    if cache["users"] is not clickup_users:
+        cache = {"users": clickup_users, "matches": {}}
+        assignee_matches = cache
+    
+    key = (name, email)
+    result = cache["matches"].get(key)
+    if result is None:
+        result = resolve_assignee(clickup_users, name, email)
+        cache["matches"][key] = result
+    return result
+
+def map_notion_assignees_to_clickup(notion_assignees, clickup_users):
+    """Map assignees từ Notion sang ClickUp IDs với matching thông minh
+    
+    clickup_users do caller lấy 1 lần mỗi cycle sync, không tra cache lại mỗi task.
+    """
     if not notion_assignees:
         return []
     
-    clickup_users = get_clickup_users()
     if not clickup_users:
         print("⚠️  Không có ClickUp users để map")
         return []
     
     clickup_ids = []
+    seen_ids = set()
     matched = []
     unmatched = []
     
@@ -225,42 +651,16 @@ def map_notion_assignees_to_clickup(notion_assignees):
         name = assignee.get("name", "")
         email = assignee.get("email", "")
         
-        user_id = None
-        matched_by = None
-        
-        # Try match by email first (chính xác nhất)
-        if email:
-            normalized_email = normalize_name(email)
-            if normalized_email in clickup_users:
-                user_id = clickup_users[normalized_email]
-                matched_by = f"email: {email}"
-            else:
-                # Try email prefix
-                email_prefix = normalize_name(email.split('@')[0])
-                if email_prefix in clickup_users:
-                    user_id = clickup_users[email_prefix]
-                    matched_by = f"email prefix: {email_prefix}"
-        
-        # Try match by name
-        if not user_id and name:
-            normalized_name = normalize_name(name)
-            if normalized_name in clickup_users:
-                user_id = clickup_users[normalized_name]
-                matched_by = f"name: {name}"
-            else:
-                # Try first/last name
-                name_parts = normalized_name.split()
-                for part in name_parts:
-                    if part in clickup_users:
-                        user_id = clickup_users[part]
-                        matched_by = f"name part: {part}"
-                        break
+        user_id, matched_by = match_assignee(clickup_users, name, email)
+        if not user_id:
+            unmatched.append(name or email)
+            continue
         
-        if user_id and user_id not in clickup_ids:
+        # Cùng 1 người có thể match qua cả name và email, chỉ thêm 1 lần
+        if user_id not in seen_ids:
+            seen_ids.add(user_id)
             clickup_ids.append(user_id)
-            matched.append(f"{name or email} → {matched_by}")
-        else:
-            unmatched.append(name or email)
+        matched.append(f"{name or email} → {matched_by}")
     
     if matched:
         print(f"      ✅ Matched assignees: {', '.join(matched)}")
@@ -270,228 +670,558 @@ def map_notion_assignees_to_clickup(notion_assignees):
     return clickup_ids
 
 # ============ NOTION API ============
-def get_notion_tasks():
-    """Lấy tasks từ Notion, sorted by created time"""
-    url = f"https://api.notion.com/v1/databases/{NOTION_DATABASE_ID}/query"
+def get_notion_tasks(created_after=None):
+    """Lấy tasks từ Notion (có phân trang), sorted by created time
     
-    headers = {
-        "Authorization": f"Bearer {NOTION_API_TOKEN}",
-        "Content-Type": "application/json",
-        "Notion-Version": "2022-06-28"
-    }
+    Nếu có created_after thì chỉ lấy tasks tạo từ thời điểm đó trở đi.
+    Trả về None nếu gọi API lỗi để phân biệt với "không có task".
+    """
+    url = f"https://api.notion.com/v1/databases/{NOTION_DATABASE_ID}/query"
     
     payload = {
-        "sorts": [{"timestamp": "created_time", "direction": "descending"}]
+        "sorts": [{"timestamp": "created_time", "direction": "descending"}],
+        "page_size": 100
     }
     
+    # created_time của Notion chỉ chính xác tới phút nên dùng on_or_after,
+    # các task trùng phút đã sync sẽ được lọc lại bằng known_task_ids
+    if created_after:
+        payload["filter"] = {
+            "timestamp": "created_time",
+            "created_time": {"on_or_after": created_after}
+        }
+    
+    results = []
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=15)
-        response.raise_for_status()
-        return response.json().get("results", [])
+        while True:
+            response = notion_session.post(url, data=orjson.dumps(payload), timeout=15)
+            response.raise_for_status()
+            data = orjson.loads(response.content)
+            results.extend(data.get("results", []))
+            
+            if not data.get("has_more"):
+                break
+            payload["start_cursor"] = data.get("next_cursor")
+        
+        return results
     except Exception as e:
         print(f"❌ Lỗi lấy data từ Notion: {e}")
         if hasattr(e, 'response') and e.response is not None:
             print(f"Response: {e.response.text}")
-        return []
+        return None
+
+# Các tên property có thể có cho từng field, ưu tiên theo thứ tự
+FIELD_ALIASES = {
+    "title": ("Tên công việc", "Name", "Task", "Title"),
+    "status": ("Trạng thái", "Status", "State"),
+    "priority": ("Mức độ ưu tiên", "Priority", "Ưu tiên"),
+    "deadline": ("Deadline", "Due Date", "Hạn", "Due"),
+    "assignees": ("Phân công", "Assign", "Assignee", "Người thực hiện"),
+    "description": ("Ghi chú", "Description", "Mô tả", "Notes"),
+}
+
+# Tên property -> (field, thứ tự ưu tiên trong FIELD_ALIASES), build 1 lần lúc import
+PROPERTY_FIELDS = {
+    name: (field, rank)
+    for field, names in FIELD_ALIASES.items()
+    for rank, name in enumerate(names)
+}
+
+def resolve_properties(props):
+    """Duyệt props 1 lần, trả về {field: property}; trùng alias thì lấy tên đứng trước"""
+    resolved = {}
+    ranks = {}
+    # Bind sẵn các hàm tra cứu dùng trong vòng lặp
+    field_of = PROPERTY_FIELDS.get
+    rank_of = ranks.get
+    for name, value in props.items():
+        match = field_of(name)
+        if match is None or value is None:
+            continue
+        field, rank = match
+        if rank < rank_of(field, len(FIELD_ALIASES[field])):
+            resolved[field] = value
+            ranks[field] = rank
+    return resolved
 
-def get_property_value(props, *possible_names):
-    """Helper để lấy property value với nhiều tên có thể"""
-    for name in possible_names:
-        if name in props:
-            return props[name]
+def extract_title(prop):
+    if prop and prop.get("title"):
+        return prop["title"][0]["text"]["content"]
+    return "Untitled Task"
+
+def extract_status(prop):
+    # Property kiểu status hoặc select đều được
+    option = prop and (prop.get("status") or prop.get("select"))
+    if option:
+        return option.get("name", "Chưa bắt đầu")
+    return "Chưa bắt đầu"
+
+def extract_priority(prop):
+    if prop and prop.get("select"):
+        return prop["select"].get("name", "Trung bình (Medium)")
+    return "Trung bình (Medium)"
+
+def extract_deadline(prop):
+    if prop and prop.get("date"):
+        return prop["date"].get("start")
     return None
 
-def format_notion_task(page):
-    """Parse và format task từ Notion page với tất cả các fields"""
-    props = page.get("properties", {})
-    
-    # Title/Name - Required
-    title_prop = get_property_value(props, "Tên công việc", "Name", "Task", "Title")
-    if title_prop and title_prop.get("title"):
-        name = title_prop["title"][0]["text"]["content"]
-    else:
-        name = "Untitled Task"
-    
-    # Status
-    status_prop = get_property_value(props, "Trạng thái", "Status", "State")
-    status = "Chưa bắt đầu"
-    if status_prop:
-        if status_prop.get("status"):
-            status = status_prop["status"].get("name", "Chưa bắt đầu")
-        elif status_prop.get("select"):
-            status = status_prop["select"].get("name", "Chưa bắt đầu")
-    
-    # Priority
-    priority_prop = get_property_value(props, "Mức độ ưu tiên", "Priority", "Ưu tiên")
-    priority = "Trung bình (Medium)"
-    if priority_prop and priority_prop.get("select"):
-        priority = priority_prop["select"].get("name", "Trung bình (Medium)")
-    
-    # Deadline/Due Date
-    deadline_prop = get_property_value(props, "Deadline", "Due Date", "Hạn", "Due")
-    deadline = None
-    if deadline_prop and deadline_prop.get("date"):
-        deadline = deadline_prop["date"].get("start")
-    
-    # Assignees
-    assignees_prop = get_property_value(props, "Phân công", "Assign", "Assignee", "Người thực hiện")
-    assignees = []
-    if assignees_prop and assignees_prop.get("people"):
-        assignees = [
+def extract_assignees(prop):
+    if prop and prop.get("people"):
+        return [
             {
                 "name": p.get("name", ""),
                 "email": p.get("email", "")
             }
-            for p in assignees_prop["people"]
+            for p in prop["people"]
         ]
-    
-    # Description/Notes
-    desc_prop = get_property_value(props, "Ghi chú", "Description", "Mô tả", "Notes")
-    description = ""
-    if desc_prop and desc_prop.get("rich_text"):
-        description = desc_prop["rich_text"][0]["text"]["content"]
-    
-    # Metadata
-    notion_id = page.get("id", "")
-    created_time = page.get("created_time", "")
-    
-    return {
-        "notion_id": notion_id,
-        "name": name,
-        "status": map_notion_status_to_clickup(status),
-        "priority": map_notion_priority_to_clickup(priority),
-        "deadline": deadline,
-        "description": description,
-        "assignees": assignees,
-        "created_time": created_time
-    }
+    return []
 
-# ============ CLICKUP API ============
-def create_clickup_task(task_data):
-    """Tạo task mới trong ClickUp với đầy đủ fields"""
-    url = f"https://api.clickup.com/api/v2/list/{CLICKUP_LIST_ID}/task"
-    
-    headers = {
-        "Authorization": CLICKUP_API_TOKEN,
-        "Content-Type": "application/json"
-    }
+def extract_description(prop):
+    if prop and prop.get("rich_text"):
+        return prop["rich_text"][0]["text"]["content"]
+    return ""
+
+# (key trong task_data, field trong FIELD_ALIASES, hàm lấy giá trị từ property)
+FIELD_EXTRACTORS = (
+    ("name", "title", extract_title),
+    ("status", "status", extract_status),
+    ("priority", "priority", extract_priority),
+    ("deadline", "deadline", extract_deadline),
+    ("assignees", "assignees", extract_assignees),
+    ("description", "description", extract_description),
+)
+
+@lru_cache(maxsize=2048)
+def iso_to_epoch_ms(value):
+    """Chuỗi ngày ISO của Notion -> timestamp (ms) cho ClickUp, nhiều task hay trùng deadline"""
+    return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000)
+
+def format_notion_task(page):
+    """Parse và format task từ Notion page với tất cả các fields"""
+    fields = resolve_properties(page.get("properties", {}))
+    task = {key: extract(fields.get(field)) for key, field, extract in FIELD_EXTRACTORS}
     
-    # Parse deadline
+    # Deadline -> timestamp (ms) cho ClickUp, parse 1 lần ở đây
     due_date = None
-    if task_data["deadline"]:
+    if task["deadline"]:
         try:
-            dt = datetime.fromisoformat(task_data["deadline"].replace('Z', '+00:00'))
-            due_date = int(dt.timestamp() * 1000)
+            due_date = iso_to_epoch_ms(task["deadline"])
         except Exception as e:
             print(f"      ⚠️  Lỗi parse deadline: {e}")
     
-    # Map assignees
-    assignee_ids = map_notion_assignees_to_clickup(task_data["assignees"])
+    task["status"] = map_notion_status_to_clickup(task["status"])
+    task["priority"] = map_notion_priority_to_clickup(task["priority"])
+    task["due_date"] = due_date
     
-    # Build payload
+    # Metadata
+    task["notion_id"] = page.get("id", "")
+    task["created_time"] = page.get("created_time", "")
+    return task
+
+# ============ CLICKUP API ============
+def build_clickup_payload(task_data, clickup_users):
+    """Các field chung của payload create/update (name, status, priority, due_date, assignees)"""
     payload = {
         "name": task_data["name"],
-        "description": f"[Notion ID: {task_data['notion_id']}]\n\n{task_data['description']}",
         "status": task_data["status"],
         "priority": task_data["priority"]
     }
     
-    if due_date:
-        payload["due_date"] = due_date
+    # due_date đã được parse sẵn trong format_notion_task
+    if task_data["due_date"]:
+        payload["due_date"] = task_data["due_date"]
     
+    assignee_ids = map_notion_assignees_to_clickup(task_data["assignees"], clickup_users)
     if assignee_ids:
         payload["assignees"] = assignee_ids
     
+    return payload
+
+# Số lần gửi lại POST tạo task khi bị 429 (429 không tạo gì nên gửi lại an toàn)
+CLICKUP_CREATE_429_RETRIES = 3
+
+def get_retry_after(response, attempt):
+    """Số giây cần chờ sau 429: Retry-After nếu có, không thì backoff 2^attempt (tối đa 60s)"""
+    try:
+        return min(max(float(response.headers.get("Retry-After")), 0.0), 60.0)
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 60)
+
+def create_clickup_task(task_data, clickup_users):
+    """Tạo task mới trong ClickUp với đầy đủ fields
+    
+    Vẫn bị 429 sau khi đã gửi lại thì raise, để task không bị đánh dấu đã sync.
+    """
+    url = f"https://api.clickup.com/api/v2/list/{CLICKUP_LIST_ID}/task"
+    
+    payload = build_clickup_payload(task_data, clickup_users)
+    payload["description"] = f"{NOTION_ID_MARKER}{task_data['notion_id']}]\n\n{task_data['description']}"
+    
+    if CLICKUP_NOTION_FIELD_ID:
+        payload["custom_fields"] = [{"id": CLICKUP_NOTION_FIELD_ID, "value": task_data["notion_id"]}]
+    
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=15)
+        body = orjson.dumps(payload)
+        for attempt in range(CLICKUP_CREATE_429_RETRIES + 1):
+            clickup_rate_limiter.consume()
+            response = clickup_session.post(url, data=body, timeout=15)
+            if response.status_code != 429 or attempt == CLICKUP_CREATE_429_RETRIES:
+                break
+            wait = get_retry_after(response, attempt)
+            print(f"      ⏳ ClickUp 429, chờ {wait:.0f}s rồi tạo lại")
+            time.sleep(wait)
         response.raise_for_status()
-        return response.json()
+        result = orjson.loads(response.content)
+        if result.get("id"):
+            remember_clickup_task(task_data["notion_id"], result["id"])
+        return result
     except Exception as e:
         print(f"❌ Lỗi tạo task ClickUp: {e}")
         if hasattr(e, 'response') and e.response is not None:
             print(f"Response: {e.response.text}")
+            if e.response.status_code == 429:
+                raise
         return None
 
-def update_clickup_task(task_id, task_data):
+def update_clickup_task(task_id, task_data, clickup_users):
     """Update task trong ClickUp"""
     url = f"https://api.clickup.com/api/v2/task/{task_id}"
-    
-    headers = {
-        "Authorization": CLICKUP_API_TOKEN,
-        "Content-Type": "application/json"
-    }
-    
-    # Parse deadline
-    due_date = None
-    if task_data["deadline"]:
-        try:
-            dt = datetime.fromisoformat(task_data["deadline"].replace('Z', '+00:00'))
-            due_date = int(dt.timestamp() * 1000)
-        except:
-            pass
-    
-    # Map assignees
-    assignee_ids = map_notion_assignees_to_clickup(task_data["assignees"])
-    
-    payload = {
-        "name": task_data["name"],
-        "status": task_data["status"],
-        "priority": task_data["priority"]
-    }
-    
-    if due_date:
-        payload["due_date"] = due_date
-    
-    if assignee_ids:
-        payload["assignees"] = assignee_ids
+    payload = build_clickup_payload(task_data, clickup_users)
     
     try:
-        response = requests.put(url, headers=headers, json=payload, timeout=15)
+        clickup_rate_limiter.consume()
+        response = clickup_session.put(url, data=orjson.dumps(payload), timeout=15)
         response.raise_for_status()
-        return response.json()
+        remember_clickup_task(task_data["notion_id"], task_id)
+        return orjson.loads(response.content)
     except Exception as e:
         print(f"❌ Lỗi update task ClickUp: {e}")
+        # Task đã bị xóa bên ClickUp: bỏ entry trong index để lần này tạo lại
+        if getattr(e, 'response', None) is not None and e.response.status_code == 404:
+            forget_clickup_task(task_data["notion_id"])
         return None
 
-def get_clickup_task_by_notion_id(notion_id):
-    """Tìm task trong ClickUp theo Notion ID"""
+# ============ CLICKUP TASK INDEX ============
+# Map notion_id -> clickup task id, thay cho việc quét cả list mỗi lần tìm.
+# Được lưu ra TASK_MAPPING_FILE, chỉ quét lại list khi tra không thấy và đã quá CACHE_TTL
+clickup_tasks_cache = None
+clickup_cache_loaded_at = 0.0
+CACHE_TTL = 60
+# Giữ khi refresh/ghi index để các worker không refresh trùng hoặc mất entry mới
+clickup_cache_lock = threading.Lock()
+# Có entry mới chưa ghi ra TASK_MAPPING_FILE
+task_mapping_dirty = False
+# Stamp của TASK_MAPPING_FILE lúc đọc/ghi gần nhất, khác đi nghĩa là process khác đã ghi
+task_mapping_mtime = None
+
+# page -> (ETag, [(notion_id, task_id)], last_page) để gửi If-None-Match khi refresh
+clickup_page_etags = {}
+
+# Marker Notion ID được ghi vào description khi tạo task
+NOTION_ID_MARKER = "[Notion ID: "
+
+def extract_notion_id(task):
+    """Lấy Notion ID của task ClickUp: ưu tiên custom field, fallback marker trong description"""
+    if CLICKUP_NOTION_FIELD_ID:
+        for field in task.get("custom_fields") or ():
+            if field.get("id") == CLICKUP_NOTION_FIELD_ID and field.get("value"):
+                return field["value"]
+    
+    # Task tạo trước khi có custom field chỉ có marker trong description.
+    # Marker là chuỗi cố định nên tách bằng partition, không cần regex
+    _, marker, rest = (task.get("description") or "").partition(NOTION_ID_MARKER)
+    if not marker:
+        return None
+    notion_id, closed, _ = rest.partition("]")
+    # Notion ID dạng UUID (có hoặc không có dấu gạch)
+    return notion_id if closed and len(notion_id) in (32, 36) else None
+
+def load_task_mapping():
+    """Đọc index đã lưu trên disk, lỗi hoặc chưa có file thì trả về dict rỗng"""
+    try:
+        with open(TASK_MAPPING_FILE, 'rb') as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️  Lỗi đọc {TASK_MAPPING_FILE}: {e}")
+        return {}
+
+def save_task_mapping():
+    """Ghi index ra disk (gọi khi đang giữ clickup_cache_lock)"""
+    global task_mapping_dirty, task_mapping_mtime
+    try:
+        write_json_atomic(TASK_MAPPING_FILE, clickup_tasks_cache)
+        task_mapping_dirty = False
+        task_mapping_mtime = get_file_stamp(TASK_MAPPING_FILE)
+    except Exception as e:
+        print(f"❌ Lỗi lưu {TASK_MAPPING_FILE}: {e}")
+
+def flush_task_mapping():
+    """Ghi index ra disk nếu có entry mới từ create/update (1 lần mỗi chu kỳ sync)"""
+    with clickup_cache_lock:
+        if task_mapping_dirty:
+            save_task_mapping()
+
+def get_clickup_tasks_index():
+    """Index trong memory, lần đầu seed từ TASK_MAPPING_FILE"""
+    global clickup_tasks_cache, task_mapping_mtime
+    if clickup_tasks_cache is None:
+        with clickup_cache_lock:
+            if clickup_tasks_cache is None:
+                task_mapping_mtime = get_file_stamp(TASK_MAPPING_FILE)
+                clickup_tasks_cache = load_task_mapping()
+    return clickup_tasks_cache
+
+def reload_task_mapping_if_changed():
+    """Gọi khi đang giữ flock: nếu process khác đã ghi TASK_MAPPING_FILE thì đọc lại
+    và cho index hết hạn, để task mới của process kia không bị tạo trùng"""
+    global clickup_tasks_cache, clickup_cache_loaded_at, task_mapping_mtime
+    # Index chưa seed (vd warm-up đang refresh) thì không có gì cũ để đọc lại, không chờ lock
+    if clickup_tasks_cache is None:
+        return
+    with clickup_cache_lock:
+        if clickup_tasks_cache is None:
+            return
+        mtime = get_file_stamp(TASK_MAPPING_FILE)
+        if mtime == task_mapping_mtime:
+            return
+        
+        mapping = load_task_mapping()
+        if task_mapping_dirty:
+            # Giữ các entry của process này chưa kịp flush
+            mapping.update(clickup_tasks_cache)
+        clickup_tasks_cache = mapping
+        task_mapping_mtime = mtime
+        clickup_cache_loaded_at = 0.0
+        print(f"   🔃 {TASK_MAPPING_FILE} đã đổi, đọc lại index ({len(mapping)} tasks)")
+
+def refresh_clickup_cache():
+    """Lấy toàn bộ tasks trong ClickUp list (có phân trang) và build lại index"""
+    global clickup_tasks_cache, clickup_cache_loaded_at
+    
     url = f"https://api.clickup.com/api/v2/list/{CLICKUP_LIST_ID}/task"
+    new_cache = {}
+    page = 0
     
-    headers = {
-        "Authorization": CLICKUP_API_TOKEN,
-        "Content-Type": "application/json"
-    }
+    try:
+        while True:
+            params = {"page": page, "include_closed": "true", "archived": "false"}
+            cached = clickup_page_etags.get(page)
+            headers = {"If-None-Match": cached[0]} if cached else None
+            clickup_rate_limiter.consume()
+            response = clickup_session.get(url, params=params, headers=headers, timeout=15)
+            
+            if response.status_code == 304 and cached:
+                # Trang không đổi: dùng lại kết quả cũ, không parse body
+                _, entries, last_page = cached
+            else:
+                response.raise_for_status()
+                data = orjson.loads(response.content)
+                tasks = data.get("tasks", [])
+                entries = [
+                    (notion_id, task.get("id"))
+                    for task in tasks
+                    for notion_id in (extract_notion_id(task),)
+                    if notion_id
+                ]
+                # ClickUp trả tối đa 100 tasks/trang và báo last_page ở trang cuối
+                last_page = not tasks or data.get("last_page", len(tasks) < 100)
+                etag = response.headers.get("ETag")
+                if etag:
+                    clickup_page_etags[page] = (etag, entries, last_page)
+                else:
+                    clickup_page_etags.pop(page, None)
+            
+            new_cache.update(entries)
+            if last_page:
+                break
+            page += 1
+        
+        changed = new_cache != clickup_tasks_cache
+        clickup_tasks_cache = new_cache
+        clickup_cache_loaded_at = time.time()
+        if changed:
+            save_task_mapping()
+        print(f"   🗂️  ClickUp index: {len(new_cache)} tasks")
+        return True
+    except Exception as e:
+        print(f"❌ Lỗi lấy danh sách task ClickUp: {e}")
+        return False
+
+def ensure_clickup_cache():
+    """Refresh index nếu đã quá CACHE_TTL (chỉ 1 thread refresh, các thread khác chờ)"""
+    if time.time() - clickup_cache_loaded_at < CACHE_TTL:
+        return
+    
+    with clickup_cache_lock:
+        if time.time() - clickup_cache_loaded_at >= CACHE_TTL:
+            refresh_clickup_cache()
+
+def remember_clickup_task(notion_id, task_id):
+    """Ghi notion_id -> task_id vào index sau khi create/update thành công (ra disk ở flush_task_mapping)"""
+    global task_mapping_dirty
+    index = get_clickup_tasks_index()
+    if index.get(notion_id) == task_id:
+        return
+    with clickup_cache_lock:
+        clickup_tasks_cache[notion_id] = task_id
+        task_mapping_dirty = True
+
+def forget_clickup_task(notion_id):
+    """Bỏ notion_id khỏi index khi task ClickUp tương ứng không còn tồn tại"""
+    global task_mapping_dirty
+    with clickup_cache_lock:
+        if clickup_tasks_cache and clickup_tasks_cache.pop(notion_id, None):
+            task_mapping_dirty = True
+
+def get_clickup_task_by_notion_id(notion_id):
+    """Tìm task trong ClickUp theo Notion ID: tra index, không thấy mới refresh (khi hết TTL)"""
+    task_id = get_clickup_tasks_index().get(notion_id)
+    if task_id:
+        return task_id
+    
+    ensure_clickup_cache()
+    return clickup_tasks_cache.get(notion_id)
+
+# ============ SYNC LOGIC ============
+# Dùng chung cho mọi chu kỳ sync để threads (và kết nối trong pool) được giữ ấm
+sync_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="sync")
+atexit.register(sync_executor.shutdown, wait=True)
+
+def process_single_task(notion_page, clickup_users):
+    """Sync 1 Notion page sang ClickUp, trả về (outcome, notion_id)"""
+    notion_id = notion_page.get("id")
     
     try:
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        tasks = response.json().get("tasks", [])
+        task_data = format_notion_task(notion_page)
+        print(f"\n      📋 Processing: {task_data['name']}")
         
-        for task in tasks:
-            description = task.get("description", "")
-            if f"[Notion ID: {notion_id}]" in description:
-                return task.get("id")
+        clickup_task_id = get_clickup_task_by_notion_id(notion_id)
         
+        if clickup_task_id:
+            result = update_clickup_task(clickup_task_id, task_data, clickup_users)
+            if result:
+                print(f"      🔄 Updated successfully")
+                outcome = "updated"
+            elif get_clickup_tasks_index().get(notion_id) is None:
+                # Entry đã bị bỏ do task ClickUp không còn (404): tạo lại
+                result = create_clickup_task(task_data, clickup_users)
+                outcome = "created" if result else "error"
+                if result:
+                    print(f"      ✨ Created successfully")
+            else:
+                outcome = "error"
+        else:
+            result = create_clickup_task(task_data, clickup_users)
+            if result:
+                print(f"      ✨ Created successfully")
+                outcome = "created"
+            else:
+                outcome = "error"
+        
+        return outcome, notion_id
+        
+    except Exception as e:
+        print(f"      ❌ Lỗi sync task: {e}")
+        with sync_status_lock:
+            sync_status["last_error"] = str(e)
+        return "exception", notion_id
+
+# Chỉ cho 1 lần sync chạy tại 1 thời điểm (thread nền, /trigger, sync_once.py)
+sync_run_lock = threading.Lock()
+
+def acquire_sync_file_lock():
+    """Lấy flock (không chờ) trên SYNC_LOCK_FILE, trả về file đang giữ lock hoặc None"""
+    lock_file = open(SYNC_LOCK_FILE, 'a')
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
         return None
-    except:
-        return None
+    return lock_file
 
-# ============ SYNC LOGIC ============
 def sync_notion_to_clickup():
+    """Sync tasks mới, bỏ qua (trả về None) nếu đã có lần sync khác đang chạy"""
+    if not sync_run_lock.acquire(blocking=False):
+        print("   ⏳ Đang có sync chạy, bỏ qua lần này")
+        return None
+    
+    try:
+        lock_file = acquire_sync_file_lock()
+        if lock_file is None:
+            print("   ⏳ Process khác đang sync, bỏ qua lần này")
+            return None
+        
+        # Đóng file là nhả flock
+        with lock_file:
+            return run_sync_cycle()
+    finally:
+        sync_run_lock.release()
+
+def prune_known_task_ids(known_data, notion_tasks):
+    """Chỉ giữ ID của page tạo từ mốc last_seen_created_time trở đi, page cũ hơn không bao giờ được query lại"""
+    cursor = known_data.get("last_seen_created_time")
+    if not cursor:
+        return
+    
+    recent_ids = {task.get("id") for task in notion_tasks if task.get("created_time", "") >= cursor}
+    known_data["task_ids"].intersection_update(recent_ids)
+
+def mark_legacy_window_known(known_task_ids, notion_tasks):
+    """State cũ (chưa có mốc created_time) chỉ snapshot 100 page mới nhất vì bản cũ không phân trang.
+    
+    Query đầy đủ đầu tiên sau khi nâng cấp sẽ trả về cả các page cũ hơn, vốn đã cố ý bỏ qua lúc
+    khởi tạo: đánh dấu đã biết mọi page tạo trước (hoặc cùng lúc) page cũ nhất đã biết, để
+    không tạo hàng loạt task ClickUp không mong muốn.
+    """
+    known_created = [
+        task.get("created_time", "") for task in notion_tasks
+        if task.get("id") in known_task_ids and task.get("created_time")
+    ]
+    if known_created:
+        oldest_known = min(known_created)
+        legacy_ids = {
+            task.get("id") for task in notion_tasks
+            if task.get("created_time", "") <= oldest_known
+        }
+    else:
+        # Không page nào khớp snapshot cũ thì không xác định được ranh giới: coi tất cả là đã biết
+        legacy_ids = {task.get("id") for task in notion_tasks}
+    
+    legacy_ids -= known_task_ids
+    if legacy_ids:
+        print(f"   📦 State cũ chưa có mốc created_time: bỏ qua {len(legacy_ids)} page ngoài snapshot ban đầu")
+        known_task_ids.update(legacy_ids)
+
+def run_sync_cycle():
+    """1 chu kỳ sync, trả về số task mới đã xử lý (None nếu không lấy được tasks từ Notion)"""
     global sync_status
     
-    print(f"\n🔄 Checking for new tasks... {datetime.now().strftime('%H:%M:%S')}")
+    # Lấy thời gian 1 lần cho cả chu kỳ sync
+    cycle_started = datetime.now()
+    now_iso = cycle_started.isoformat()
+    
+    print(f"\n🔄 Checking for new tasks... {cycle_started.strftime('%H:%M:%S')}")
     
+    # Đang giữ flock: đọc lại state nếu process khác (worker khác, sync_once.py) vừa ghi,
+    # nếu không sẽ query từ mốc cũ và compaction sẽ xóa mất entry của process kia
     known_data = load_known_tasks()
-    known_task_ids = set(known_data.get("task_ids", []))
+    reload_task_mapping_if_changed()
+    known_task_ids = known_data["task_ids"]
     is_initialized = known_data.get("initialized", False)
     
-    notion_tasks = get_notion_tasks()
-    if not notion_tasks:
+    last_seen = known_data.get("last_seen_created_time") if is_initialized else None
+    
+    notion_tasks = get_notion_tasks(created_after=last_seen)
+    if notion_tasks is None:
         print("   ⚠️  Không lấy được tasks từ Notion")
-        return
+        return None
     
-    current_task_ids = [task.get("id") for task in notion_tasks]
+    # Bỏ ID trùng (page có thể lặp lại giữa 2 trang kết quả khi DB thay đổi lúc phân trang)
+    current_task_ids = list(dict.fromkeys(task.get("id") for task in notion_tasks))
+    newest_created = max((task.get("created_time", "") for task in notion_tasks), default="")
     
     if not is_initialized:
         print("🎯 Lần đầu chạy - Đang lưu snapshot của tasks hiện tại...")
@@ -500,18 +1230,30 @@ def sync_notion_to_clickup():
         print("   ✅ Từ giờ sẽ chỉ sync tasks MỚI được tạo!")
         
         known_data = {
-            "task_ids": current_task_ids,
+            "task_ids": set(current_task_ids),
             "initialized": True,
-            "initialized_at": datetime.now().isoformat()
+            "initialized_at": now_iso,
+            "last_seen_created_time": newest_created or None
         }
+        prune_known_task_ids(known_data, notion_tasks)
         save_known_tasks(known_data)
-        return
+        return 0
+    
+    if not last_seen:
+        mark_legacy_window_known(known_task_ids, notion_tasks)
+    
+    if newest_created > (last_seen or ""):
+        known_data["last_seen_created_time"] = newest_created
     
     new_task_ids = [tid for tid in current_task_ids if tid not in known_task_ids]
     
     if not new_task_ids:
         print("   ✨ Không có task mới")
-        return
+        # State cũ chưa có mốc created_time thì lưu lại để lần sau chỉ query phần mới
+        prune_known_task_ids(known_data, notion_tasks)
+        if known_data.get("last_seen_created_time") != last_seen:
+            save_known_tasks(known_data)
+        return 0
     
     print(f"   🆕 Phát hiện {len(new_task_ids)} task mới!")
     
@@ -519,86 +1261,168 @@ def sync_notion_to_clickup():
     updated = 0
     errors = 0
     
-    for notion_page in notion_tasks:
-        notion_id = notion_page.get("id")
+    # Chuẩn bị index và users trước để các worker không cùng fetch lại
+    index = get_clickup_tasks_index()
+    if any(notion_id not in index for notion_id in new_task_ids):
+        ensure_clickup_cache()
+    clickup_users = get_clickup_users()
+    
+    # Mỗi notion_id chỉ submit đúng 1 lần để không tạo trùng task ClickUp
+    pages_by_id = {page.get("id"): page for page in notion_tasks}
+    futures = [
+        sync_executor.submit(process_single_task, pages_by_id[notion_id], clickup_users)
+        for notion_id in new_task_ids
+    ]
+    
+    synced_ids = []
+    retry_from = None
+    
+    for future in as_completed(futures):
+        outcome, notion_id = future.result()
         
-        if notion_id not in new_task_ids:
-            continue
+        if outcome == "created":
+            created += 1
+        elif outcome == "updated":
+            updated += 1
+        else:
+            errors += 1
         
-        try:
-            task_data = format_notion_task(notion_page)
-            print(f"\n      📋 Processing: {task_data['name']}")
-            
-            clickup_task_id = get_clickup_task_by_notion_id(notion_id)
-            
-            if clickup_task_id:
-                result = update_clickup_task(clickup_task_id, task_data)
-                if result:
-                    updated += 1
-                    print(f"      🔄 Updated successfully")
-                else:
-                    errors += 1
-            else:
-                result = create_clickup_task(task_data)
-                if result:
-                    created += 1
-                    print(f"      ✨ Created successfully")
-                else:
-                    errors += 1
-            
+        # Task lỗi do exception sẽ được thử lại ở lần sync sau
+        if outcome != "exception":
             known_task_ids.add(notion_id)
-            time.sleep(0.3)
-            
-        except Exception as e:
-            print(f"      ❌ Lỗi sync task: {e}")
-            errors += 1
-            sync_status["last_error"] = str(e)
+            synced_ids.append(notion_id)
+        else:
+            failed_created = pages_by_id[notion_id].get("created_time", "")
+            retry_from = min(retry_from or failed_created, failed_created)
     
-    known_data["task_ids"] = list(known_task_ids)
-    save_known_tasks(known_data)
+    # Không đẩy mốc created_time qua task lỗi, nếu không lần sau query sẽ bỏ sót nó
+    if retry_from and retry_from < (known_data.get("last_seen_created_time") or ""):
+        known_data["last_seen_created_time"] = retry_from
+    
+    # Lưu index trước khi đánh dấu task đã sync
+    flush_task_mapping()
+    
+    # Log chỉ ghi ID mới, set đã prune được ghi ra snapshot ở lần compact
+    prune_known_task_ids(known_data, notion_tasks)
+    # Mọi task đều lỗi và mốc không đổi thì không có gì mới để ghi
+    if synced_ids or known_data.get("last_seen_created_time") != last_seen:
+        append_known_tasks(known_data, synced_ids)
     
     if created > 0 or updated > 0:
         print(f"\n   ✅ Sync done: {created} created, {updated} updated")
+    if errors > 0:
+        print(f"   ⚠️  {errors} errors")
+    
+    with sync_status_lock:
         sync_status["total_synced"] += created + updated
-        if errors > 0:
-            print(f"   ⚠️  {errors} errors")
-            sync_status["errors"] += errors
+        sync_status["errors"] += errors
+        sync_status["last_sync"] = now_iso
     
-    sync_status["last_sync"] = datetime.now().isoformat()
+    return len(new_task_ids)
 
 # ============ BACKGROUND SYNC THREAD ============
+# Gom nhiều lần /trigger liên tiếp thành 1 lần sync
+TRIGGER_DEBOUNCE = 0.5
+trigger_timer = None
+trigger_lock = threading.Lock()
+# /trigger set() để thread nền dậy sync ngay thay vì đợi hết SYNC_INTERVAL
+sync_wake = threading.Event()
+
+def run_sync_once():
+    """Chạy 1 lần sync, ghi nhận lỗi vào sync_status thay vì raise; trả về số task mới"""
+    try:
+        return sync_notion_to_clickup()
+    except Exception as e:
+        print(f"❌ Error in sync: {e}")
+        with sync_status_lock:
+            sync_status["errors"] += 1
+            sync_status["last_error"] = str(e)
+        return None
+
+def request_sync():
+    """Đánh thức thread nền nếu đang chạy, không thì sync luôn trong timer thread"""
+    if is_sync_loop_running():
+        sync_wake.set()
+    else:
+        run_sync_once()
+
+def schedule_sync():
+    """Hẹn sync sau TRIGGER_DEBOUNCE giây, trigger mới sẽ dời lịch cũ"""
+    global trigger_timer
+    
+    with trigger_lock:
+        if trigger_timer is not None:
+            trigger_timer.cancel()
+        trigger_timer = threading.Timer(TRIGGER_DEBOUNCE, request_sync)
+        trigger_timer.daemon = True
+        trigger_timer.start()
+
 def background_sync_loop():
     global sync_status
     
-    sync_status["running"] = True
-    sync_interval = 15
+    with sync_status_lock:
+        sync_status["running"] = True
     
-    print("🔍 Loading ClickUp users...")
-    users = get_clickup_users()
-    print(f"✅ Ready to match assignees with {len(users)} name variants\n")
+    # Load users và refresh index ClickUp song song với lần sync đầu thay vì chờ tuần tự;
+    # nếu sync cần tới thì get_clickup_users / ensure_clickup_cache sẽ chờ đúng lần fetch đang chạy
+    print("🔍 Loading ClickUp users & task index...")
+    sync_executor.submit(get_clickup_users)
+    sync_executor.submit(ensure_clickup_cache)
     
-    while sync_status["running"]:
-        try:
-            sync_notion_to_clickup()
-        except Exception as e:
-            print(f"❌ Error in sync: {e}")
-            sync_status["errors"] += 1
-            sync_status["last_error"] = str(e)
+    # Lịch cố định tính từ lúc bắt đầu mỗi lần sync (không phải work + interval)
+    next_run = time.monotonic()
+    idle_cycles = 0
+    while is_sync_loop_running():
+        new_tasks = run_sync_once()
+        
+        # Không có task mới thì giãn dần chu kỳ poll, có hoạt động thì quay về SYNC_INTERVAL
+        idle_cycles = idle_cycles + 1 if new_tasks == 0 else 0
+        interval = min(SYNC_INTERVAL * 2 ** min(idle_cycles, 10), max(SYNC_MAX_INTERVAL, SYNC_INTERVAL))
+        next_run += interval
+        now = time.monotonic()
+        if next_run <= now:
+            # Sync chạy quá lâu: gộp các lượt bị lỡ thành 1 lượt chạy ngay, không chạy bù
+            next_run = now
         
-        time.sleep(sync_interval)
+        sync_wake.wait(next_run - now)
+        if sync_wake.is_set():
+            # Sync do /trigger hoặc webhook, lịch tiếp theo tính lại từ lúc này
+            sync_wake.clear()
+            next_run = time.monotonic()
+            idle_cycles = 0
+
+sync_thread = None
+sync_thread_lock = threading.Lock()
+
+def start_background_sync():
+    """Start thread sync nền đúng 1 lần (gọi từ __main__ hoặc hook của gunicorn)"""
+    global sync_thread
+    
+    # Tắt khi sync chạy bằng cron / sync_once.py
+    if not RUN_BACKGROUND_SYNC:
+        print("⏭️  Background sync tắt (RUN_BACKGROUND_SYNC=0)")
+        return
+    
+    with sync_thread_lock:
+        if sync_thread is not None:
+            return
+        sync_thread = threading.Thread(target=background_sync_loop, daemon=True)
+        sync_thread.start()
+    print("✅ Background sync thread started")
 
 # ============ FLASK ROUTES ============
 @app.route('/')
 def home():
     known_data = load_known_tasks()
+    status = get_sync_status()
     return jsonify({
         "status": "running",
         "service": "Notion → ClickUp Sync (Optimized)",
-        "service_started": sync_status["service_started"],
-        "last_sync": sync_status["last_sync"],
-        "total_synced": sync_status["total_synced"],
-        "errors": sync_status["errors"],
-        "last_error": sync_status["last_error"],
+        "service_started": status["service_started"],
+        "last_sync": status["last_sync"],
+        "total_synced": status["total_synced"],
+        "errors": status["errors"],
+        "last_error": status["last_error"],
         "known_tasks": len(known_data.get("task_ids", [])),
         "initialized": known_data.get("initialized", False),
         "data_path": KNOWN_TASKS_FILE
@@ -606,14 +1430,15 @@ def home():
 
 @app.route('/health')
 def health():
-    return jsonify({"status": "ok"}), 200
+    # Không format datetime ở đây để health check luôn nhẹ nhất có thể
+    return jsonify({"status": "ok", "ts": time.time()}), 200
 
 @app.route('/status')
 def status():
     known_data = load_known_tasks()
     users = get_clickup_users()
     return jsonify({
-        "sync_status": sync_status,
+        "sync_status": get_sync_status(),
         "known_tasks": len(known_data.get("task_ids", [])),
         "initialized": known_data.get("initialized", False),
         "initialized_at": known_data.get("initialized_at", None),
@@ -625,15 +1450,52 @@ def status():
 @app.route('/trigger')
 def trigger():
     try:
-        sync_notion_to_clickup()
-        return jsonify({"status": "success", "message": "Sync triggered manually"})
+        schedule_sync()
+        return jsonify({"status": "accepted", "message": "Sync scheduled"}), 202
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
+
+# Event Notion webhook cần sync lại
+WEBHOOK_SYNC_EVENTS = {"page.created", "page.undeleted"}
+
+@app.route('/notion-webhook', methods=['POST'])
+def notion_webhook():
+    """Nhận event từ Notion webhook và hẹn sync (gom event liên tiếp như /trigger)"""
+    body = request.get_data()
+    try:
+        event = orjson.loads(body or b"{}")
+    except orjson.JSONDecodeError:
+        return jsonify({"status": "error", "message": "Invalid JSON"}), 400
+    # JSON hợp lệ nhưng không phải object (vd [] hay "x") thì không có field nào để đọc
+    if not isinstance(event, dict):
+        return jsonify({"status": "error", "message": "Invalid JSON"}), 400
+    
+    # Lần đăng ký đầu tiên Notion chỉ gửi verification_token để xác nhận trong UI
+    if "verification_token" in event:
+        print(f"🔑 Notion webhook verification_token: {event['verification_token']}")
+        print("   👉 Dán token vào Notion để xác nhận và set NOTION_WEBHOOK_TOKEN")
+        return jsonify({"status": "ok"}), 200
+    
+    if NOTION_WEBHOOK_TOKEN:
+        expected = "sha256=" + hmac.new(NOTION_WEBHOOK_TOKEN.encode(), body, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, request.headers.get("X-Notion-Signature", "")):
+            return jsonify({"status": "error", "message": "Invalid signature"}), 401
+    
+    if event.get("type") not in WEBHOOK_SYNC_EVENTS:
+        return jsonify({"status": "ignored"}), 200
+    
+    schedule_sync()
+    return jsonify({"status": "accepted", "message": "Sync scheduled"}), 202
    
 @app.route('/reset')
 def reset():
     """Reset state - Xóa file và bắt đầu lại từ đầu"""
+    global known_tasks_memory, known_tasks_mtime
     try:
+        known_tasks_memory = None
+        known_tasks_mtime = None
+        if os.path.exists(KNOWN_TASKS_LOG):
+            os.remove(KNOWN_TASKS_LOG)
         if os.path.exists(KNOWN_TASKS_FILE):
             os.remove(KNOWN_TASKS_FILE)
             return jsonify({
@@ -648,6 +1510,16 @@ def reset():
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/refresh-users')
+def refresh_users():
+    """Bỏ cache và load lại ClickUp users"""
+    invalidate_clickup_users()
+    users = get_clickup_users()
+    return jsonify({
+        "status": "success",
+        "total_variants": len(users)
+    })
+
 @app.route('/users')
 def users():
     """View cached ClickUp users"""
@@ -662,10 +1534,7 @@ if __name__ == '__main__':
     print("🚀 Notion → ClickUp Flask Sync Service (Optimized)")
     print("=" * 60)
     
-    # Start background sync thread
-    sync_thread = threading.Thread(target=background_sync_loop, daemon=True)
-    sync_thread.start()
-    print("✅ Background sync thread started")
+    start_background_sync()
     
     # Start Flask app
     port = int(os.environ.get('PORT', 5000))
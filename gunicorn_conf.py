@@ -0,0 +1,16 @@
+"""Cấu hình gunicorn: gunicorn -c gunicorn_conf.py app:app"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Chỉ 1 worker để chỉ có 1 thread sync nền, request được phục vụ bằng threads
+workers = 1
+worker_class = "gthread"
+threads = 4
+timeout = 120
+keepalive = 5
+
+def post_worker_init(worker):
+    """gunicorn không chạy __main__ của app.py nên start thread sync ở đây"""
+    from app import start_background_sync
+    start_background_sync()
@@ -0,0 +1,13 @@
+"""
+Chạy sync Notion → ClickUp đúng 1 lần rồi thoát
+Dùng cho Render Cron Job / worker riêng khi set RUN_BACKGROUND_SYNC=0 cho web service
+"""
+
+import sys
+
+from app import get_sync_status, run_sync_once
+
+if __name__ == '__main__':
+    errors_before = get_sync_status()["errors"]
+    run_sync_once()
+    sys.exit(1 if get_sync_status()["errors"] > errors_before else 0)